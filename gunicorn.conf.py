@@ -0,0 +1,37 @@
+"""
+Gunicorn settings for the Spotwego dashboard.
+
+Gunicorn reads this file automatically when started from the repository
+root (e.g. `gunicorn app:app`, which is what Azure App Service runs).
+Command-line flags still take precedence.
+"""
+
+import os
+
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+
+# Threaded workers: while one request waits on PostgreSQL or an outbound API
+# call, the other threads of the same process keep serving requests.
+# Keep threads <= DB_POOL_MAX so every thread can hold a pooled connection.
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 600))
+
+# Import the app - and run init_db() - once in the master; workers inherit
+# it copy-on-write instead of each repeating the startup work
+preload_app = True
+
+
+def when_ready(server):
+    # Runs in the master before workers are forked: don't let them inherit
+    # the database connections opened by init_db()
+    from app import close_pool
+    close_pool()
+
+
+def post_worker_init(worker):
+    # Each worker opens its own pool after fork: warm it before taking traffic
+    from app import Config, prewarm
+    if Config.PREWARM:
+        prewarm()